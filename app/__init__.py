@@ -3,6 +3,7 @@ from flask_pymongo import PyMongo
 from flask_cors import CORS
 
 from app.config import Config
+from app.utils.json_provider import ORJSONProvider
 
 mongo = PyMongo()  # global mongo instance
 
@@ -10,6 +11,7 @@ mongo = PyMongo()  # global mongo instance
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = ORJSONProvider(app)
 
     # Initialize MongoDB
     try:
@@ -28,6 +30,12 @@ def create_app():
                 collections = mongo.db.list_collection_names()
                 print(f"📊 Available collections: {collections}")
 
+                # Index backing the per-user/controller audit queries (user_email + audit_date range)
+                mongo.db.school_audits.create_index([('user_email', 1), ('audit_date', 1), ('status', 1)])
+                # Index backing the audit log listing (performed_by + action, newest first)
+                mongo.db.audit_logs.create_index([('performed_by', 1), ('performed_at', -1), ('action', 1)])
+                print("✅ MongoDB indexes ensured")
+
             except Exception as db_error:
                 print(f"❌ Database connection test failed: {str(db_error)}")
                 print(f"🔍 mongo.db value: {mongo.db}")
@@ -10,6 +10,9 @@ class Config:
     MONGO_URI = os.getenv("MONGO_URI")
     SECRET_KEY = os.getenv("SECRET_KEY")
 
+    # JSON/base64 image transport is kept for older app builds; new clients send multipart/form-data
+    ALLOW_BASE64_IMAGE_UPLOADS = os.getenv("ALLOW_BASE64_IMAGE_UPLOADS", "true").lower() == "true"
+
     # Fallback for development
     if not MONGO_URI:
         MONGO_URI = "mongodb://localhost:27017/your_app_db"
@@ -1,15 +1,28 @@
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, current_app
 from app import mongo
-from datetime import datetime, timedelta
-import pytz
-import io
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 import xlsxwriter
 from flask import send_file
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument, UpdateOne
 import uuid
 import re
+import string
+import tempfile
 import urllib.parse
 import base64
+import hashlib
+import json
+import itertools
+import threading
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache, TTLCache
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Import the updated OneDrive upload functions
 from app.utils.gcs_upload import (
@@ -18,9 +31,142 @@ from app.utils.gcs_upload import (
     get_onedrive_file_info,
     convert_sharepoint_urls_to_file_ids
 )
+from app.utils.json_provider import orjson_dumps
 
 school_audit_bp = Blueprint('school_audit', __name__)
-IST_TZ = pytz.timezone('Asia/Kolkata')
+IST_TZ = ZoneInfo('Asia/Kolkata')
+
+# Documents fetched per round trip when streaming summary/export cursors
+CURSOR_BATCH_SIZE = 500
+MIGRATION_BATCH_SIZE = 500
+EXPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Directory for constant_memory sheet XML and the spooled workbook; defaults to the system temp dir.
+# Only point this at tmpfs (e.g. /dev/shm) if it is sized for the largest export, Docker's default is 64 MB.
+EXPORT_TMPDIR = os.getenv('EXPORT_TMPDIR') or None
+
+# Excel export columns, in the order build_export_row produces them
+EXPORT_HEADERS = [
+    'Audit ID', 'Date', 'Auditor Email', 'School Name', 'City', 'Latitude', 'Longitude',
+    'Start Time', 'End Time', 'Duration (min)', 'Promoters Count', 'Total Students',
+    'Boost Sachets', 'Giveaways', 'Sessions Completed', 'Teacher Count',
+    'Session 1 Enabled', 'Session 1 Students', 'Session 1 Winner', 'Session 1 Winner Class',
+    'Session 2 Enabled', 'Session 2 Students', 'Session 2 Winner', 'Session 2 Winner Class',
+    'Session 3 Enabled', 'Session 3 Students', 'Session 3 Winner', 'Session 3 Winner Class',
+    'Auditor Remarks', 'Status', 'Start Image URL', 'End Image URL', 'Audit Sheet URL'
+]
+EXPORT_TOTAL_STUDENTS_COL = EXPORT_HEADERS.index('Total Students')
+EXPORT_SACHETS_COL = EXPORT_HEADERS.index('Boost Sachets')
+EXPORT_STATUS_COL = EXPORT_HEADERS.index('Status')
+EXPORT_URL_COL = EXPORT_HEADERS.index('Start Image URL')  # image URL columns run to the end of the row
+EXPORT_SESSION_KEYS = ('session1', 'session2', 'session3')
+DISABLED_SESSION_COLUMNS = ('No', '', '', '')
+
+# Only the fields the export rows / summary statistics read are fetched from MongoDB
+EXPORT_PROJECTION = {
+    'audit_date': 1, 'user_email': 1, 'school_name': 1, 'city': 1, 'location': 1,
+    'start_timestamp': 1, 'end_timestamp': 1, 'session_duration_minutes': 1, 'promoters_count': 1,
+    'total_students': 1, 'boost_sachets_given': 1, 'giveaways_given': 1, 'sessions_completed': 1,
+    'teacher_count': 1, 'sessions': 1, 'auditor_remarks': 1, 'status': 1,
+    'start_image_file_id': 1, 'end_image_file_id': 1, 'audit_sheet_image_file_id': 1
+}
+SUMMARY_PROJECTION = {
+    '_id': 0, 'status': 1, 'total_students': 1, 'boost_sachets_given': 1,
+    'sessions_completed': 1, 'school_name': 1, 'city': 1
+}
+MIGRATION_PROJECTION = {
+    'students_session1': 1, 'students_session2': 1, 'students_session3': 1,
+    'winners_session1': 1, 'winners_session2': 1, 'winners_session3': 1
+}
+
+# Summary of a DELETE log's deleted_audit_data (removed from logs without one)
+DELETED_AUDIT_SUMMARY = {
+    '$cond': [
+        {'$eq': [{'$type': '$deleted_audit_data'}, 'object']},
+        {
+            'school_name': {'$ifNull': ['$deleted_audit_data.school_name', None]},
+            'city': {'$ifNull': ['$deleted_audit_data.city', None]},
+            'audit_date': {'$ifNull': ['$deleted_audit_data.audit_date', None]},
+            'status': {'$ifNull': ['$deleted_audit_data.status', None]},
+            'students_total': {'$ifNull': ['$deleted_audit_data.total_students', 0]}
+        },
+        '$$REMOVE'
+    ]
+}
+
+# Top-level audit image fields and session image fields (-> filename suffix)
+IMAGE_FIELDS = ('start_image', 'end_image', 'audit_sheet_image')
+EDIT_IMAGE_UPLOADS = {
+    'start_image': 'audit_start_updated',
+    'end_image': 'audit_end_updated',
+    'audit_sheet_image': 'audit_sheet_updated'
+}
+SESSION_IMAGE_FIELDS = {
+    'startSelfie': 'start_selfie',
+    'endSelfie': 'end_selfie',
+    'winnerPhoto': 'winner',
+    'sachetDistributionPhoto': 'distribution'
+}
+
+# Update pipeline computing total_students server-side: enabled sessions' studentsCount
+# plus any legacy students_sessionN fields
+TOTAL_STUDENTS_BACKFILL_PIPELINE = [
+    {"$set": {"total_students": {"$add": [
+        {"$sum": {"$map": {
+            "input": {"$objectToArray": {
+                "$cond": [{"$eq": [{"$type": "$sessions"}, "object"]}, "$sessions", {}]
+            }},
+            "as": "s",
+            "in": {"$cond": [
+                {"$eq": ["$$s.v.enabled", True]},
+                {"$convert": {"input": "$$s.v.studentsCount", "to": "int", "onError": 0, "onNull": 0}},
+                0
+            ]}
+        }}},
+        {"$convert": {"input": "$students_session1", "to": "int", "onError": 0, "onNull": 0}},
+        {"$convert": {"input": "$students_session2", "to": "int", "onError": 0, "onNull": 0}},
+        {"$convert": {"input": "$students_session3", "to": "int", "onError": 0, "onNull": 0}}
+    ]}}}
+]
+
+# Characters urllib.parse.quote(..., safe='') leaves untouched
+URL_SAFE_CHARS = frozenset(string.ascii_letters + string.digits + '_.-~')
+
+# Audit images never change once uploaded, so browsers/CDNs may cache them for a year
+IMAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Image bytes keyed by (file_id, resize), bounded by total size rather than entry count.
+# The limit is per gunicorn worker, so an instance holds up to WEB_CONCURRENCY x IMAGE_CACHE_MAX_BYTES.
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+image_cache = LRUCache(maxsize=IMAGE_CACHE_MAX_BYTES, getsizeof=len)
+image_cache_lock = threading.Lock()
+
+# Users under a controller from the attendance service, keyed by (controller_email, auth header hash)
+CONTROLLER_USERS_URL = 'https://field-app-346502099828.asia-south1.run.app/api/attendance/users'
+controller_users_cache = TTLCache(maxsize=512, ttl=60)
+controller_users_cache_lock = threading.Lock()
+
+# Pooled keep-alive session for the attendance service, shared across requests
+CONTROLLER_USERS_TIMEOUT = (2, 5)  # (connect, read) seconds
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    max_retries=Retry(total=2, backoff_factor=0.2)
+))
+
+# (epoch second, 'DD Mon YYYY') - today's IST date, refreshed at most once per second
+_today_date_cache = (0, '')
+
+
+def get_today_date_str():
+    """Get today's IST date string ('%d %b %Y'), cached for the current second"""
+    global _today_date_cache
+    now_second = int(time.time())
+    cached_second, today_date = _today_date_cache
+    if cached_second != now_second:
+        today_date = datetime.now(IST_TZ).strftime('%d %b %Y')
+        _today_date_cache = (now_second, today_date)
+    return today_date
 
 
 def generate_unique_filename(user_email, audit_type, original_extension='jpg'):
@@ -92,6 +238,62 @@ def upload_image_to_onedrive(image_data, filename):
         return f"UPLOAD_FAILED: {str(e)}"
 
 
+def get_audit_request_data():
+    """
+    Read audit request data from multipart/form-data or JSON.
+    Multipart files are passed on as streams: 'start_image' style fields go on the top level and
+    '<session_key>_<imageField>' fields (e.g. session1_startSelfie) are attached to their session.
+    Raises ValueError for malformed form fields.
+    """
+    if request.mimetype != 'multipart/form-data':
+        return request.get_json()
+
+    data = request.form.to_dict()
+    if data.get('sessions'):
+        try:
+            data['sessions'] = json.loads(data['sessions'])
+        except ValueError:
+            raise ValueError('Invalid sessions JSON')
+
+    # Form fields arrive as strings; store coordinates as numbers like JSON requests do
+    for field in ('latitude', 'longitude'):
+        if data.get(field):
+            try:
+                data[field] = float(data[field])
+            except ValueError:
+                raise ValueError(f'Invalid {field}')
+
+    sessions_data = data.get('sessions')
+    for field_name, file_storage in request.files.items():
+        session_key, _, image_field = field_name.partition('_')
+        if (image_field in SESSION_IMAGE_FIELDS and isinstance(sessions_data, dict)
+                and isinstance(sessions_data.get(session_key), dict)):
+            sessions_data[session_key][image_field] = {'file': file_storage.stream}
+        else:
+            data[field_name] = file_storage.stream
+
+    return data
+
+
+def is_base64_upload_rejected(data):
+    """Check if a JSON request carries base64 images while base64 uploads are disabled"""
+    if current_app.config.get('ALLOW_BASE64_IMAGE_UPLOADS', True) or request.mimetype == 'multipart/form-data':
+        return False
+
+    if any(data.get(field) for field in IMAGE_FIELDS):
+        return True
+
+    sessions_data = data.get('sessions')
+    if isinstance(sessions_data, dict):
+        for session_data in sessions_data.values():
+            if isinstance(session_data, dict) and any(
+                    isinstance(session_data.get(field), dict) and session_data[field].get('base64')
+                    for field in SESSION_IMAGE_FIELDS):
+                return True
+
+    return False
+
+
 def process_sessions_data(sessions_data, user_email):
     """Process sessions data and upload images"""
     processed_sessions = {}
@@ -116,40 +318,37 @@ def process_sessions_data(sessions_data, user_email):
             'sachetDistributionPhoto': None
         }
 
-        # Upload session images
-        if session_data.get('startSelfie', {}).get('base64'):
-            filename = generate_unique_filename(user_email, f'{session_key}_start_selfie', 'jpg')
-            processed_session['startSelfie'] = upload_image_to_onedrive(
-                f"data:image/jpeg;base64,{session_data['startSelfie']['base64']}",
-                filename
-            )
-
-        if session_data.get('endSelfie', {}).get('base64'):
-            filename = generate_unique_filename(user_email, f'{session_key}_end_selfie', 'jpg')
-            processed_session['endSelfie'] = upload_image_to_onedrive(
-                f"data:image/jpeg;base64,{session_data['endSelfie']['base64']}",
-                filename
-            )
-
-        if session_data.get('winnerPhoto', {}).get('base64'):
-            filename = generate_unique_filename(user_email, f'{session_key}_winner', 'jpg')
-            processed_session['winnerPhoto'] = upload_image_to_onedrive(
-                f"data:image/jpeg;base64,{session_data['winnerPhoto']['base64']}",
-                filename
-            )
+        # Upload session images (streamed multipart file or base64 from JSON)
+        for image_field, filename_suffix in SESSION_IMAGE_FIELDS.items():
+            image = session_data.get(image_field) or {}
+            if image.get('file') is not None:
+                image_data = image['file']
+            elif image.get('base64'):
+                image_data = f"data:image/jpeg;base64,{image['base64']}"
+            else:
+                continue
 
-        if session_data.get('sachetDistributionPhoto', {}).get('base64'):
-            filename = generate_unique_filename(user_email, f'{session_key}_distribution', 'jpg')
-            processed_session['sachetDistributionPhoto'] = upload_image_to_onedrive(
-                f"data:image/jpeg;base64,{session_data['sachetDistributionPhoto']['base64']}",
-                filename
-            )
+            filename = generate_unique_filename(user_email, f'{session_key}_{filename_suffix}', 'jpg')
+            processed_session[image_field] = upload_image_to_onedrive(image_data, filename)
 
         processed_sessions[session_key] = processed_session
 
     return processed_sessions
 
 
+def parse_student_count(value):
+    """Student count as an int, accepting numbers and numeric strings like '30' or '30.0'; 0 if unparseable"""
+    try:
+        return int(float(value or 0))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+def count_session_students(sessions):
+    """Total students across processed sessions, persisted as total_students whenever sessions are written"""
+    return sum(parse_student_count(session.get('studentsCount')) for session in sessions.values())
+
+
 def create_image_url(base_url, file_id):
     """Helper function to create image URLs from file IDs - FIXED"""
     if not file_id or file_id == '' or file_id is None or str(file_id).startswith('UPLOAD_FAILED'):
@@ -163,8 +362,11 @@ def create_image_url(base_url, file_id):
         return ''
 
     try:
-        # URL encode the file ID to handle special characters
-        encoded_file_id = urllib.parse.quote(clean_file_id, safe='')
+        # URL encode the file ID to handle special characters (plain OneDrive IDs need no quoting)
+        if URL_SAFE_CHARS.issuperset(clean_file_id):
+            encoded_file_id = clean_file_id
+        else:
+            encoded_file_id = urllib.parse.quote(clean_file_id, safe='')
         image_url = f"{base_url}/api/school-audit/image/{encoded_file_id}?resize=true"
 
         print(f"DEBUG: Created image URL: {image_url}")
@@ -175,6 +377,38 @@ def create_image_url(base_url, file_id):
         return ''
 
 
+def fetch_controller_users(controller_email, auth_header):
+    """Get the user emails under a controller (None if the attendance service refuses), cached for 60s"""
+    # Only a digest of the token is kept in the cache key
+    cache_key = (controller_email, hashlib.blake2b(auth_header.encode('utf-8'), digest_size=16).hexdigest())
+    with controller_users_cache_lock:
+        users = controller_users_cache.get(cache_key)
+    if users is not None:
+        return users
+
+    controller_users_response = http_session.get(
+        CONTROLLER_USERS_URL,
+        params={'controllerEmail': controller_email},
+        headers={'Authorization': auth_header},
+        timeout=CONTROLLER_USERS_TIMEOUT
+    )
+    if controller_users_response.status_code != 200:
+        return None
+
+    users = controller_users_response.json().get('users', [])
+    with controller_users_cache_lock:
+        controller_users_cache[cache_key] = users
+    return users
+
+
+def audit_to_log_data(audit):
+    """Copy an audit document for audit_logs with its ObjectId/datetime values as strings"""
+    return {
+        key: str(value) if key == '_id' else value.isoformat() if isinstance(value, datetime) else value
+        for key, value in audit.items()
+    }
+
+
 def format_audit_response(audit, base_url):
     """Format audit response with session image URLs - COMPLETELY FIXED VERSION"""
     # Convert ObjectId to string
@@ -225,11 +459,92 @@ def format_audit_response(audit, base_url):
     return audit
 
 
+def build_export_image_url(base_url, file_id):
+    """Image URL for an export row - same URL as create_image_url without its per-call debug logging"""
+    if not file_id:
+        return ''
+
+    clean_file_id = str(file_id).strip()
+    if not clean_file_id or clean_file_id == 'None' or clean_file_id.startswith('UPLOAD_FAILED'):
+        return ''
+
+    if not URL_SAFE_CHARS.issuperset(clean_file_id):
+        clean_file_id = urllib.parse.quote(clean_file_id, safe='')
+    return f"{base_url}/api/school-audit/image/{clean_file_id}?resize=true"
+
+
+def to_int_or_blank(value):
+    """Convert counts stored as text (e.g. studentsCount) to int so Excel gets numeric cells"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return '' if value is None else value
+
+
+def build_export_session_columns(session):
+    """Export columns for one session: enabled, students, winner name, winner class"""
+    get = session.get
+    if not get('enabled'):
+        return DISABLED_SESSION_COLUMNS
+    return 'Yes', to_int_or_blank(get('studentsCount', '')), get('winnerName', ''), get('winnerClass', '')
+
+
+def build_export_row(audit, base_url):
+    """Build a single Excel export row for an audit"""
+    # Bind the dict lookups used for every column once per row
+    fa = audit.get
+
+    # Session columns for session1..session3, four per session
+    sessions = fa('sessions') or {}
+    session_columns = []
+    for session_key in EXPORT_SESSION_KEYS:
+        session_columns.extend(build_export_session_columns(sessions.get(session_key) or {}))
+
+    # Extract location coordinates
+    location = fa('location', {})
+    latitude = location.get('latitude', '') if isinstance(location, dict) else ''
+    longitude = location.get('longitude', '') if isinstance(location, dict) else ''
+
+    data_row = [
+        str(fa('_id', '')),
+        fa('audit_date', ''),
+        fa('user_email', ''),
+        fa('school_name', ''),
+        fa('city', ''),
+        latitude,
+        longitude,
+        start_ts.partition(',')[2].strip() if (start_ts := fa('start_timestamp')) else '',
+        end_ts.partition(',')[2].strip() if (end_ts := fa('end_timestamp')) else '',
+        fa('session_duration_minutes', 0),
+        fa('promoters_count', 0),
+        # total_students is stored on every audit (see /backfill-total-students)
+        fa('total_students', 0),
+        fa('boost_sachets_given', 0),
+        fa('giveaways_given', ''),
+        fa('sessions_completed', 0),
+        fa('teacher_count', 0),
+        *session_columns,
+        fa('auditor_remarks', ''),
+        fa('status', ''),
+        build_export_image_url(base_url, fa('start_image_file_id')),
+        build_export_image_url(base_url, fa('end_image_file_id')),
+        build_export_image_url(base_url, fa('audit_sheet_image_file_id'))
+    ]
+
+    return data_row
+
+
 @school_audit_bp.route('/start-audit', methods=['POST'])
 def start_audit():
     """Start school audit session"""
     try:
-        data = request.get_json()
+        try:
+            data = get_audit_request_data()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if is_base64_upload_rejected(data):
+            return jsonify({'error': 'Base64 image uploads are disabled, send images as multipart/form-data'}), 415
 
         required_fields = ['latitude', 'longitude', 'school_name', 'city', 'start_image',
                            'timestamp', 'user_email', 'promoters_count', 'sessions']
@@ -253,7 +568,7 @@ def start_audit():
         try:
             dt_from_frontend = datetime.fromisoformat(timestamp_str)
             if dt_from_frontend.tzinfo is None:
-                localized_dt = IST_TZ.localize(dt_from_frontend)
+                localized_dt = dt_from_frontend.replace(tzinfo=IST_TZ)
             else:
                 localized_dt = dt_from_frontend.astimezone(IST_TZ)
         except ValueError:
@@ -285,10 +600,7 @@ def start_audit():
         processed_sessions = process_sessions_data(sessions_data, data['user_email'])
 
         # Calculate total students from enabled sessions
-        total_students = sum(
-            int(session.get('studentsCount', 0) or 0)
-            for session in processed_sessions.values()
-        )
+        total_students = count_session_students(processed_sessions)
 
         # Create audit record
         audit_record = {
@@ -342,7 +654,13 @@ def start_audit():
 def end_audit():
     """End school audit session"""
     try:
-        data = request.get_json()
+        try:
+            data = get_audit_request_data()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if is_base64_upload_rejected(data):
+            return jsonify({'error': 'Base64 image uploads are disabled, send images as multipart/form-data'}), 415
 
         required_fields = ['audit_id', 'end_image', 'timestamp', 'sessions_completed',
                            'teacher_count', 'auditor_remarks']
@@ -369,7 +687,7 @@ def end_audit():
         try:
             dt_from_frontend = datetime.fromisoformat(timestamp_str)
             if dt_from_frontend.tzinfo is None:
-                localized_dt = IST_TZ.localize(dt_from_frontend)
+                localized_dt = dt_from_frontend.replace(tzinfo=IST_TZ)
             else:
                 localized_dt = dt_from_frontend.astimezone(IST_TZ)
         except ValueError:
@@ -384,18 +702,14 @@ def end_audit():
         if not end_file_id:
             return jsonify({'error': 'Failed to upload end image'}), 500
 
-        # Calculate session duration
-        try:
-            start_time = datetime.strptime(audit['start_timestamp'].split(',')[1].strip(), '%I:%M %p IST')
-            end_time = datetime.strptime(ist_display_str.split(',')[1].strip(), '%I:%M %p IST')
-
-            # Handle day boundary crossing
-            if end_time < start_time:
-                end_time += timedelta(days=1)
-
-            duration_minutes = int((end_time - start_time).total_seconds() / 60)
-        except Exception as duration_error:
-            print(f"⚠️ Error calculating duration: {str(duration_error)}")
+        # Calculate session duration from the stored start datetime
+        start_dt = audit.get('created_at')
+        if start_dt:
+            if start_dt.tzinfo is None:
+                # PyMongo returns naive datetimes in UTC
+                start_dt = start_dt.replace(tzinfo=timezone.utc)
+            duration_minutes = max(int((localized_dt - start_dt).total_seconds() // 60), 0)
+        else:
             duration_minutes = 0
 
         # Update audit record
@@ -438,7 +752,7 @@ def get_audit_image(file_id):
     """Enhanced proxy endpoint that handles both file IDs and SharePoint URLs"""
     try:
         # Decode the file_id in case it's URL encoded
-        decoded_file_id = urllib.parse.unquote(file_id)
+        decoded_file_id = urllib.parse.unquote(file_id) if '%' in file_id else file_id
 
         print(f"🔍 Image request - Original: {file_id}")
         print(f"🔍 Image request - Decoded: {decoded_file_id}")
@@ -450,8 +764,26 @@ def get_audit_image(file_id):
         # Get resized parameter
         resize = request.args.get('resize', 'true').lower() == 'true'
 
-        # Use the enhanced function that handles both file IDs and SharePoint URLs
-        image_content = get_onedrive_image_content(decoded_file_id, resize=resize)
+        # File IDs are immutable once uploaded, so the ID + resize flag identify the image bytes
+        etag = hashlib.md5(f"{decoded_file_id}:{resize}".encode()).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag, weak=True)
+            not_modified.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+            return not_modified
+
+        # Serve repeat requests from the in-process cache before going to OneDrive
+        cache_key = (decoded_file_id, resize)
+        with image_cache_lock:
+            image_content = image_cache.get(cache_key)
+
+        if image_content is None:
+            # Use the enhanced function that handles both file IDs and SharePoint URLs
+            image_content = get_onedrive_image_content(decoded_file_id, resize=resize)
+
+            if image_content and len(image_content) <= image_cache.maxsize:
+                with image_cache_lock:
+                    image_cache[cache_key] = image_content
 
         if not image_content:
             print(f"❌ Image not found for: {decoded_file_id}")
@@ -462,10 +794,11 @@ def get_audit_image(file_id):
             image_content,
             mimetype='image/jpeg',
             headers={
-                'Cache-Control': 'public, max-age=86400',  # Cache for 1 day
+                'Cache-Control': IMAGE_CACHE_CONTROL,
                 'Content-Type': 'image/jpeg'
             }
         )
+        response.set_etag(etag, weak=True)
         return response
 
     except Exception as e:
@@ -504,11 +837,13 @@ def get_user_audits(user_email):
 
         formatted_audits = [format_audit_response(audit, base_url) for audit in audits]
 
-        return jsonify({
+        # Largest response in the API - serialize straight to bytes, skipping jsonify
+        payload = orjson_dumps({
             'audits': formatted_audits,
             'user_email': user_email,
             'total_count': len(formatted_audits)
-        }), 200
+        })
+        return Response(payload, mimetype='application/json'), 200
 
     except Exception as e:
         print(f"❌ Error fetching audits: {str(e)}")
@@ -521,7 +856,7 @@ def get_user_audits(user_email):
 def get_current_audit(user_email):
     """Get current in-progress audit for a user"""
     try:
-        today_date = datetime.now(IST_TZ).strftime('%d %b %Y')
+        today_date = get_today_date_str()
 
         audit = mongo.db.school_audits.find_one({
             "user_email": user_email,
@@ -565,12 +900,13 @@ def get_audit_summary(user_email):
                 "$lte": end_date
             }
 
-        audits = list(mongo.db.school_audits.find(query))
+        # Stream the projected documents; only the running totals and name sets are kept
+        audits = mongo.db.school_audits.find(query, SUMMARY_PROJECTION).batch_size(CURSOR_BATCH_SIZE)
 
         # Calculate statistics
-        total_audits = len(audits)
-        completed_audits = len([a for a in audits if a['status'] == 'completed'])
-        in_progress_audits = len([a for a in audits if a['status'] == 'in_progress'])
+        total_audits = 0
+        completed_audits = 0
+        in_progress_audits = 0
 
         total_students_reached = 0
         total_sachets_distributed = 0
@@ -579,27 +915,15 @@ def get_audit_summary(user_email):
         unique_cities = set()
 
         for audit in audits:
-            # Use new total_students field or calculate from sessions
-            if 'total_students' in audit:
-                total_students_reached += audit['total_students']
-            else:
-                # Fallback: calculate from sessions or old structure
-                sessions = audit.get('sessions', {})
-                if isinstance(sessions, dict):
-                    for session in sessions.values():
-                        if isinstance(session, dict) and session.get('enabled'):
-                            total_students_reached += int(session.get('studentsCount', 0) or 0)
-                else:
-                    # Old structure fallback
-                    total_students_reached += (
-                            audit.get('students_session1', 0) +
-                            audit.get('students_session2', 0) +
-                            audit.get('students_session3', 0)
-                    )
+            total_audits += 1
+            total_students_reached += audit.get('total_students', 0)
 
             total_sachets_distributed += audit.get('boost_sachets_given', 0)
             if audit['status'] == 'completed':
+                completed_audits += 1
                 total_sessions_completed += audit.get('sessions_completed', 0)
+            elif audit['status'] == 'in_progress':
+                in_progress_audits += 1
             unique_schools.add(audit['school_name'])
             unique_cities.add(audit['city'])
 
@@ -642,20 +966,12 @@ def export_audits_excel():
         controller_user_emails = []
         if controller_email:
             try:
-                import requests
                 auth_header = request.headers.get('Authorization')
                 if not auth_header:
                     return jsonify({"error": "Authorization header required"}), 401
 
-                controller_users_response = requests.get(
-                    f'https://field-app-346502099828.asia-south1.run.app/api/attendance/users?controllerEmail={controller_email}',
-                    headers={'Authorization': auth_header}
-                )
-
-                if controller_users_response.status_code == 200:
-                    controller_data = controller_users_response.json()
-                    controller_user_emails = controller_data.get('users', [])
-                else:
+                controller_user_emails = fetch_controller_users(controller_email, auth_header)
+                if controller_user_emails is None:
                     return jsonify({"error": "Failed to fetch users under controller"}), 400
 
             except Exception as e:
@@ -674,14 +990,24 @@ def export_audits_excel():
 
         query['audit_date'] = {'$gte': start_date, '$lte': end_date}
 
-        audits = list(mongo.db.school_audits.find(query).sort('created_at', -1))
+        # Stream audits from the cursor straight into the sheet instead of materializing them
+        audits = mongo.db.school_audits.find(query, EXPORT_PROJECTION).sort('created_at', -1).batch_size(CURSOR_BATCH_SIZE)
+        first_audit = next(audits, None)
 
-        if len(audits) == 0:
+        if first_audit is None:
             return jsonify({"error": "No audit data found for the selected criteria"}), 404
 
         # Create Excel file
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+        # constant_memory flushes each row as it is written, so rows must go out in order.
+        # The xlsx is spooled to disk past 8 MB and streamed from there by send_file.
+        output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES, dir=EXPORT_TMPDIR)
+        # strings_to_urls is off so write_row doesn't regex-check every text cell; the image URL
+        # columns are written explicitly with write_url below
+        workbook = xlsxwriter.Workbook(output, {
+            'constant_memory': True,
+            'strings_to_urls': False,
+            'tmpdir': EXPORT_TMPDIR
+        })
 
         # Define formats
         header_format = workbook.add_format({
@@ -699,135 +1025,17 @@ def export_audits_excel():
             'valign': 'vcenter'
         })
 
+        url_format = workbook.add_format({
+            'border': 1,
+            'align': 'center',
+            'valign': 'vcenter',
+            'font_color': 'blue',
+            'underline': 1
+        })
+
         # Create main worksheet
         worksheet = workbook.add_worksheet("School Audits")
 
-        # Enhanced headers with session data
-        headers = [
-            'Audit ID', 'Date', 'Auditor Email', 'School Name', 'City', 'Latitude', 'Longitude',
-            'Start Time', 'End Time', 'Duration (min)', 'Promoters Count', 'Total Students',
-            'Boost Sachets', 'Giveaways', 'Sessions Completed', 'Teacher Count',
-            'Session 1 Enabled', 'Session 1 Students', 'Session 1 Winner', 'Session 1 Winner Class',
-            'Session 2 Enabled', 'Session 2 Students', 'Session 2 Winner', 'Session 2 Winner Class',
-            'Session 3 Enabled', 'Session 3 Students', 'Session 3 Winner', 'Session 3 Winner Class',
-            'Auditor Remarks', 'Status', 'Start Image URL', 'End Image URL', 'Audit Sheet URL'
-        ]
-
-        # Write headers
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header, header_format)
-
-        # Write data
-        row = 1
-        base_url = request.url_root.rstrip('/')
-
-        for audit in audits:
-            # Calculate total students
-            total_students = audit.get('total_students', 0)
-            if not total_students:
-                # Fallback calculation
-                sessions = audit.get('sessions', {})
-                if isinstance(sessions, dict):
-                    total_students = sum(
-                        int(session.get('studentsCount', 0) or 0)
-                        for session in sessions.values()
-                        if session.get('enabled', False)
-                    )
-
-            # Get session data
-            sessions = audit.get('sessions', {})
-            session1 = sessions.get('session1', {})
-            session2 = sessions.get('session2', {})
-            session3 = sessions.get('session3', {})
-
-            # Get main image URLs
-            start_url = create_image_url(base_url, audit.get('start_image_file_id'))
-            end_url = create_image_url(base_url, audit.get('end_image_file_id'))
-            sheet_url = create_image_url(base_url, audit.get('audit_sheet_image_file_id'))
-
-            # Extract location coordinates
-            location = audit.get('location', {})
-            latitude = location.get('latitude', '') if isinstance(location, dict) else ''
-            longitude = location.get('longitude', '') if isinstance(location, dict) else ''
-
-            data_row = [
-                str(audit.get('_id', '')),
-                audit.get('audit_date', ''),
-                audit.get('user_email', ''),
-                audit.get('school_name', ''),
-                audit.get('city', ''),
-                latitude,
-                longitude,
-                audit.get('start_timestamp', '').split(',')[1].strip() if audit.get('start_timestamp') else '',
-                audit.get('end_timestamp', '').split(',')[1].strip() if audit.get('end_timestamp') else '',
-                audit.get('session_duration_minutes', 0),
-                audit.get('promoters_count', 0),
-                total_students,
-                audit.get('boost_sachets_given', 0),
-                audit.get('giveaways_given', ''),
-                audit.get('sessions_completed', 0),
-                audit.get('teacher_count', 0),
-                'Yes' if session1.get('enabled', False) else 'No',
-                session1.get('studentsCount', '') if session1.get('enabled', False) else '',
-                session1.get('winnerName', '') if session1.get('enabled', False) else '',
-                session1.get('winnerClass', '') if session1.get('enabled', False) else '',
-                'Yes' if session2.get('enabled', False) else 'No',
-                session2.get('studentsCount', '') if session2.get('enabled', False) else '',
-                session2.get('winnerName', '') if session2.get('enabled', False) else '',
-                session2.get('winnerClass', '') if session2.get('enabled', False) else '',
-                'Yes' if session3.get('enabled', False) else 'No',
-                session3.get('studentsCount', '') if session3.get('enabled', False) else '',
-                session3.get('winnerName', '') if session3.get('enabled', False) else '',
-                session3.get('winnerClass', '') if session3.get('enabled', False) else '',
-                audit.get('auditor_remarks', ''),
-                audit.get('status', ''),
-                start_url,
-                end_url,
-                sheet_url
-            ]
-
-            for col, value in enumerate(data_row):
-                if col == 1:  # Date column
-                    worksheet.write(row, col, value, cell_format)
-                else:
-                    worksheet.write(row, col, value, cell_format)
-            row += 1
-
-        # Add summary row
-        summary_row = row + 1
-        worksheet.write(summary_row, 0, 'SUMMARY:', header_format)
-        worksheet.write(summary_row, 1, f'Total Audits: {len(audits)}', header_format)
-        worksheet.write(summary_row, 2, f'Controller: {controller_email}', header_format)
-        worksheet.write(summary_row, 3, f'Date Range: {start_date} to {end_date}', header_format)
-
-        # Calculate totals
-        total_students_all = 0
-        total_sachets_all = 0
-        completed_audits = 0
-
-        for audit in audits:
-            if audit.get('status') == 'completed':
-                completed_audits += 1
-
-            # Calculate total students
-            if 'total_students' in audit:
-                total_students_all += audit['total_students']
-            else:
-                sessions = audit.get('sessions', {})
-                if isinstance(sessions, dict):
-                    for session in sessions.values():
-                        if isinstance(session, dict) and session.get('enabled'):
-                            total_students_all += int(session.get('studentsCount', 0) or 0)
-
-            total_sachets_all += audit.get('boost_sachets_given', 0)
-
-        worksheet.write(summary_row + 1, 0, 'Total Students Reached:', cell_format)
-        worksheet.write(summary_row + 1, 1, total_students_all, cell_format)
-        worksheet.write(summary_row + 1, 2, 'Total Sachets Distributed:', cell_format)
-        worksheet.write(summary_row + 1, 3, total_sachets_all, cell_format)
-        worksheet.write(summary_row + 1, 4, 'Completed Audits:', cell_format)
-        worksheet.write(summary_row + 1, 5, completed_audits, cell_format)
-
         # Set column widths
         worksheet.set_column(0, 0, 25)  # Audit ID
         worksheet.set_column(1, 1, 15)  # Date
@@ -842,6 +1050,50 @@ def export_audits_excel():
         worksheet.set_column(30, 30, 12)  # Status
         worksheet.set_column(31, 33, 50)  # Image URLs
 
+        # Write headers
+        worksheet.write_row(0, 0, EXPORT_HEADERS, header_format)
+
+        # Write data, accumulating the summary totals in the same pass
+        row = 1
+        base_url = request.url_root.rstrip('/')
+        total_audits = 0
+        total_students_all = 0
+        total_sachets_all = 0
+        completed_audits = 0
+
+        for audit in itertools.chain([first_audit], audits):
+            data_row = build_export_row(audit, base_url)
+            worksheet.write_row(row, 0, data_row[:EXPORT_URL_COL], cell_format)
+            for col in range(EXPORT_URL_COL, len(data_row)):
+                url = data_row[col]
+                if not url:
+                    worksheet.write_blank(row, col, None, cell_format)
+                elif worksheet.write_url(row, col, url, url_format) < 0:
+                    # Past Excel's URL length/count limits - keep the URL as plain text
+                    worksheet.write_string(row, col, url, url_format)
+            row += 1
+
+            total_audits += 1
+            total_students_all += data_row[EXPORT_TOTAL_STUDENTS_COL]
+            total_sachets_all += data_row[EXPORT_SACHETS_COL]
+            completed_audits += data_row[EXPORT_STATUS_COL] == 'completed'
+
+        # Summary goes on its own sheet - audit rows are already flushed in constant_memory mode
+        summary_sheet = workbook.add_worksheet("Summary")
+        summary_sheet.set_column(0, 5, 28)
+
+        summary_sheet.write(0, 0, 'SUMMARY:', header_format)
+        summary_sheet.write(0, 1, f'Total Audits: {total_audits}', header_format)
+        summary_sheet.write(0, 2, f'Controller: {controller_email}', header_format)
+        summary_sheet.write(0, 3, f'Date Range: {start_date} to {end_date}', header_format)
+
+        summary_sheet.write(1, 0, 'Total Students Reached:', cell_format)
+        summary_sheet.write(1, 1, total_students_all, cell_format)
+        summary_sheet.write(1, 2, 'Total Sachets Distributed:', cell_format)
+        summary_sheet.write(1, 3, total_sachets_all, cell_format)
+        summary_sheet.write(1, 4, 'Completed Audits:', cell_format)
+        summary_sheet.write(1, 5, completed_audits, cell_format)
+
         workbook.close()
         output.seek(0)
 
@@ -877,19 +1129,10 @@ def get_controller_audit_summary(controller_email):
 
         # First, get all users under this controller
         try:
-            import requests
-
-            controller_users_response = requests.get(
-                f'https://field-app-346502099828.asia-south1.run.app/api/attendance/users?controllerEmail={controller_email}',
-                headers={'Authorization': auth_header}
-            )
-
-            if controller_users_response.status_code != 200:
+            controller_user_emails = fetch_controller_users(controller_email, auth_header)
+            if controller_user_emails is None:
                 return jsonify({"error": "Failed to fetch users under controller"}), 400
 
-            controller_data = controller_users_response.json()
-            controller_user_emails = controller_data.get('users', [])
-
         except Exception as e:
             print(f"❌ Error fetching controller users: {str(e)}")
             return jsonify({"error": "Failed to fetch controller users"}), 500
@@ -923,38 +1166,35 @@ def get_controller_audit_summary(controller_email):
                 "$lte": end_date
             }
 
-        audits = list(mongo.db.school_audits.find(query))
-
-        # Calculate statistics
-        total_audits = len(audits)
-        completed_audits = len([a for a in audits if a['status'] == 'completed'])
-        in_progress_audits = len([a for a in audits if a['status'] == 'in_progress'])
-
-        total_students_reached = 0
-        total_sachets_distributed = 0
-        total_sessions_completed = 0
-        unique_schools = set()
-        unique_cities = set()
-        active_users = set()
-
-        for audit in audits:
-            # Use new total_students field or calculate from sessions
-            if 'total_students' in audit:
-                total_students_reached += audit['total_students']
-            else:
-                # Fallback: calculate from sessions
-                sessions = audit.get('sessions', {})
-                if isinstance(sessions, dict):
-                    for session in sessions.values():
-                        if isinstance(session, dict) and session.get('enabled'):
-                            total_students_reached += int(session.get('studentsCount', 0) or 0)
-
-            total_sachets_distributed += audit.get('boost_sachets_given', 0)
-            if audit['status'] == 'completed':
-                total_sessions_completed += audit.get('sessions_completed', 0)
-            unique_schools.add(audit['school_name'])
-            unique_cities.add(audit['city'])
-            active_users.add(audit['user_email'])
+        # Aggregate server-side so only the totals and distinct values come back
+        pipeline = [
+            {"$match": query},
+            {"$group": {
+                "_id": None,
+                "total_audits": {"$sum": 1},
+                "completed_audits": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}},
+                "in_progress_audits": {"$sum": {"$cond": [{"$eq": ["$status", "in_progress"]}, 1, 0]}},
+                "total_students_reached": {"$sum": {"$ifNull": ["$total_students", 0]}},
+                "total_sachets_distributed": {"$sum": {"$ifNull": ["$boost_sachets_given", 0]}},
+                "total_sessions_completed": {"$sum": {
+                    "$cond": [{"$eq": ["$status", "completed"]}, {"$ifNull": ["$sessions_completed", 0]}, 0]
+                }},
+                "schools": {"$addToSet": "$school_name"},
+                "cities": {"$addToSet": "$city"},
+                "users": {"$addToSet": "$user_email"}
+            }}
+        ]
+        stats = next(mongo.db.school_audits.aggregate(pipeline), {})
+
+        total_audits = stats.get('total_audits', 0)
+        completed_audits = stats.get('completed_audits', 0)
+        in_progress_audits = stats.get('in_progress_audits', 0)
+        total_students_reached = stats.get('total_students_reached', 0)
+        total_sachets_distributed = stats.get('total_sachets_distributed', 0)
+        total_sessions_completed = stats.get('total_sessions_completed', 0)
+        unique_schools = stats.get('schools', [])
+        unique_cities = stats.get('cities', [])
+        active_users = stats.get('users', [])
 
         summary = {
             'total_audits': total_audits,
@@ -967,11 +1207,11 @@ def get_controller_audit_summary(controller_email):
             'unique_schools_visited': len(unique_schools),
             'unique_cities_covered': len(unique_cities),
             'average_students_per_audit': round(total_students_reached / max(completed_audits, 1), 1),
-            'schools_list': list(unique_schools),
-            'cities_list': list(unique_cities),
+            'schools_list': unique_schools,
+            'cities_list': unique_cities,
             'active_users': len(active_users),
             'total_users_under_controller': len(controller_user_emails),
-            'users_list': list(active_users)
+            'users_list': active_users
         }
 
         return jsonify({
@@ -988,26 +1228,26 @@ def get_controller_audit_summary(controller_email):
 def edit_audit(audit_id):
     """Edit audit - only allowed for today's audits"""
     try:
-        data = request.get_json()
+        try:
+            data = get_audit_request_data()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if is_base64_upload_rejected(data):
+            return jsonify({'error': 'Base64 image uploads are disabled, send images as multipart/form-data'}), 415
 
         # Get the audit record
-        audit = mongo.db.school_audits.find_one({"_id": ObjectId(audit_id)})
+        oid = ObjectId(audit_id)
+        audit = mongo.db.school_audits.find_one({"_id": oid})
         if not audit:
             return jsonify({'error': 'Audit record not found'}), 404
 
         # Check if audit is from today
-        today_date = datetime.now(IST_TZ).strftime('%d %b %Y')
+        now = datetime.now(IST_TZ)
+        today_date = now.strftime('%d %b %Y')
         if audit['audit_date'] != today_date:
             return jsonify({'error': 'Only today\'s audits can be edited'}), 403
 
-        # Store original data for logging
-        original_data = dict(audit)
-        original_data['_id'] = str(original_data['_id'])
-        if 'created_at' in original_data:
-            original_data['created_at'] = original_data['created_at'].isoformat()
-        if 'completed_at' in original_data:
-            original_data['completed_at'] = original_data['completed_at'].isoformat()
-
         # Prepare update fields
         update_fields = {}
         updatable_fields = [
@@ -1028,52 +1268,52 @@ def edit_audit(audit_id):
             update_fields['sessions'] = processed_sessions
 
             # Recalculate total students
-            total_students = sum(
-                int(session.get('studentsCount', 0) or 0)
-                for session in processed_sessions.values()
-            )
-            update_fields['total_students'] = total_students
+            update_fields['total_students'] = count_session_students(processed_sessions)
 
         # Handle image updates if provided
         user_email = audit['user_email']
 
-        if data.get('start_image'):
-            start_filename = generate_unique_filename(user_email, 'audit_start_updated', 'jpg')
-            update_fields['start_image_file_id'] = upload_image_to_onedrive(data['start_image'], start_filename)
-
-        if data.get('end_image'):
-            end_filename = generate_unique_filename(user_email, 'audit_end_updated', 'jpg')
-            update_fields['end_image_file_id'] = upload_image_to_onedrive(data['end_image'], end_filename)
-
-        if data.get('audit_sheet_image'):
-            sheet_filename = generate_unique_filename(user_email, 'audit_sheet_updated', 'jpg')
-            update_fields['audit_sheet_image_file_id'] = upload_image_to_onedrive(data['audit_sheet_image'],
-                                                                                  sheet_filename)
+        # Upload replaced images concurrently, total latency is the slowest upload
+        with ThreadPoolExecutor(max_workers=len(EDIT_IMAGE_UPLOADS)) as executor:
+            futures = {
+                f'{image_field}_file_id': executor.submit(
+                    upload_image_to_onedrive,
+                    data[image_field],
+                    generate_unique_filename(user_email, filename_prefix, 'jpg')
+                )
+                for image_field, filename_prefix in EDIT_IMAGE_UPLOADS.items()
+                if data.get(image_field)
+            }
+            for file_id_field, future in futures.items():
+                update_fields[file_id_field] = future.result()
 
         if not update_fields:
             return jsonify({'error': 'No valid fields to update'}), 400
 
         # Add last modified timestamp
-        update_fields['last_modified_at'] = datetime.now(IST_TZ)
+        update_fields['last_modified_at'] = now
         update_fields['last_modified_by'] = user_email
 
-        # Update the audit record
-        result = mongo.db.school_audits.update_one(
-            {"_id": ObjectId(audit_id)},
-            {"$set": update_fields}
+        # Update the audit record and get it back in one round trip; the audit_date filter
+        # re-checks the today-only rule atomically
+        updated_audit = mongo.db.school_audits.find_one_and_update(
+            {"_id": oid, "audit_date": today_date},
+            {"$set": update_fields},
+            return_document=ReturnDocument.AFTER
         )
 
-        if result.modified_count == 0:
+        if not updated_audit:
             return jsonify({'error': 'Failed to update audit record'}), 500
 
-        # Log the edit action
+        # Log the edit action as a diff: prior values of the changed fields and their new values
+        prior = {key: audit[key] for key in update_fields if key in audit}
         edit_log = {
             "action": "EDIT",
             "audit_id": audit_id,
-            "original_data": original_data,
-            "updated_fields": update_fields,
+            "before": audit_to_log_data(prior),
+            "after": update_fields,
             "performed_by": user_email,
-            "performed_at": datetime.now(IST_TZ),
+            "performed_at": now,
             "ip_address": request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR')),
             "user_agent": request.headers.get('User-Agent'),
             "school_name": audit['school_name'],
@@ -1082,8 +1322,6 @@ def edit_audit(audit_id):
 
         mongo.db.audit_logs.insert_one(edit_log)
 
-        # Get updated audit record
-        updated_audit = mongo.db.school_audits.find_one({"_id": ObjectId(audit_id)})
         base_url = request.url_root.rstrip('/')
         formatted_audit = format_audit_response(updated_audit, base_url)
 
@@ -1109,22 +1347,19 @@ def delete_audit(audit_id):
         deletion_reason = data.get('reason', 'No reason provided')
 
         # Get the audit record
-        audit = mongo.db.school_audits.find_one({"_id": ObjectId(audit_id)})
+        oid = ObjectId(audit_id)
+        audit = mongo.db.school_audits.find_one({"_id": oid})
         if not audit:
             return jsonify({'error': 'Audit record not found'}), 404
 
         # Check if audit is from today
-        today_date = datetime.now(IST_TZ).strftime('%d %b %Y')
+        now = datetime.now(IST_TZ)
+        today_date = now.strftime('%d %b %Y')
         if audit['audit_date'] != today_date:
             return jsonify({'error': 'Only today\'s audits can be deleted'}), 403
 
         # Store complete audit data for logging
-        audit_data = dict(audit)
-        audit_data['_id'] = str(audit_data['_id'])
-        if 'created_at' in audit_data:
-            audit_data['created_at'] = audit_data['created_at'].isoformat()
-        if 'completed_at' in audit_data:
-            audit_data['completed_at'] = audit_data['completed_at'].isoformat()
+        audit_data = audit_to_log_data(audit)
 
         # Log the deletion before deleting
         deletion_log = {
@@ -1133,7 +1368,7 @@ def delete_audit(audit_id):
             "deleted_audit_data": audit_data,
             "deletion_reason": deletion_reason,
             "performed_by": audit['user_email'],
-            "performed_at": datetime.now(IST_TZ),
+            "performed_at": now,
             "ip_address": request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR')),
             "user_agent": request.headers.get('User-Agent'),
             "school_name": audit['school_name'],
@@ -1144,7 +1379,7 @@ def delete_audit(audit_id):
         mongo.db.audit_logs.insert_one(deletion_log)
 
         # Delete the audit record
-        result = mongo.db.school_audits.delete_one({"_id": ObjectId(audit_id)})
+        result = mongo.db.school_audits.delete_one({"_id": oid})
 
         if result.deleted_count == 0:
             return jsonify({'error': 'Failed to delete audit record'}), 500
@@ -1189,7 +1424,13 @@ def get_audit_logs(user_email):
             except ValueError:
                 return jsonify({'error': 'Invalid date format'}), 400
 
-        logs = list(mongo.db.audit_logs.find(query).sort('performed_at', -1).limit(limit))
+        # The deleted audit summary is built server-side so the full deleted_audit_data is never sent
+        pipeline = [{'$match': query}, {'$sort': {'performed_at': -1}}]
+        if limit > 0:  # find().limit(0) meant no limit, $limit requires a positive value
+            pipeline.append({'$limit': limit})
+        pipeline.append({'$addFields': {'deleted_audit_summary': DELETED_AUDIT_SUMMARY}})
+        pipeline.append({'$project': {'deleted_audit_data': 0}})
+        logs = mongo.db.audit_logs.aggregate(pipeline)
 
         # Format response
         formatted_logs = []
@@ -1197,19 +1438,6 @@ def get_audit_logs(user_email):
             log['_id'] = str(log['_id'])
             if 'performed_at' in log:
                 log['performed_at'] = log['performed_at'].isoformat()
-
-            # Remove sensitive data for response
-            if 'deleted_audit_data' in log:
-                deleted_data = log['deleted_audit_data']
-                log['deleted_audit_summary'] = {
-                    'school_name': deleted_data.get('school_name'),
-                    'city': deleted_data.get('city'),
-                    'audit_date': deleted_data.get('audit_date'),
-                    'status': deleted_data.get('status'),
-                    'students_total': deleted_data.get('total_students', 0)
-                }
-                del log['deleted_audit_data']
-
             formatted_logs.append(log)
 
         return jsonify({
@@ -1229,6 +1457,7 @@ def migrate_legacy_audits():
     """Migration endpoint to convert old audit structure to new session structure"""
     try:
         migrated_count = 0
+        operations = []
         audits = mongo.db.school_audits.find({
             "sessions": {"$exists": False},  # Audits without new sessions structure
             "$or": [
@@ -1236,7 +1465,7 @@ def migrate_legacy_audits():
                 {"students_session2": {"$exists": True}},
                 {"students_session3": {"$exists": True}}
             ]
-        })
+        }, MIGRATION_PROJECTION).batch_size(MIGRATION_BATCH_SIZE)
 
         for audit in audits:
             # Create new sessions structure from old data
@@ -1287,26 +1516,21 @@ def migrate_legacy_audits():
                     'sachetDistributionPhoto': None
                 }
 
-            # Calculate total students
-            total_students = (
-                    audit.get('students_session1', 0) +
-                    audit.get('students_session2', 0) +
-                    audit.get('students_session3', 0)
-            )
-
             # Update the audit record
             update_fields = {
                 'sessions': sessions,
-                'total_students': total_students,
+                'total_students': count_session_students(sessions),
                 'migrated_at': datetime.now(IST_TZ),
                 'migration_version': '2.0'
             }
 
-            mongo.db.school_audits.update_one(
-                {"_id": audit['_id']},
-                {"$set": update_fields}
-            )
-            migrated_count += 1
+            operations.append(UpdateOne({"_id": audit['_id']}, {"$set": update_fields}))
+            if len(operations) >= MIGRATION_BATCH_SIZE:
+                migrated_count += mongo.db.school_audits.bulk_write(operations, ordered=False).matched_count
+                operations.clear()
+
+        if operations:
+            migrated_count += mongo.db.school_audits.bulk_write(operations, ordered=False).matched_count
 
         return jsonify({
             'message': f'Migration completed. Migrated {migrated_count} audit records to new session structure.',
@@ -1320,6 +1544,27 @@ def migrate_legacy_audits():
         return jsonify({'error': 'Migration failed'}), 500
 
 
+@school_audit_bp.route('/backfill-total-students', methods=['POST'])
+def backfill_total_students():
+    """One-time backfill of total_students for audits created before the field existed"""
+    try:
+        result = mongo.db.school_audits.update_many(
+            {"total_students": {"$exists": False}},
+            TOTAL_STUDENTS_BACKFILL_PIPELINE
+        )
+
+        return jsonify({
+            'message': f'Backfill completed. Updated {result.modified_count} audit records.',
+            'updated_count': result.modified_count
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Error backfilling total students: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': 'Backfill failed'}), 500
+
+
 # Existing endpoints for SharePoint URL conversion and other maintenance tasks
 @school_audit_bp.route('/convert-sharepoint-urls', methods=['POST'])
 def convert_sharepoint_urls():
@@ -1,13 +1,161 @@
 import base64
+import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pymongo import UpdateOne
+from cachetools import LRUCache
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import json
+import orjson
 import io
-from PIL import Image
 import tempfile
-import urllib.parse
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+# Graph/login calls share pooled keep-alive connections; transient 5xx responses are retried with backoff
+# and the last response is returned for the caller to check. Throttling (429/503) is handled by
+# OneDriveUploader.request so every thread backs off together.
+GRAPH_RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=[500, 502, 504],
+    allowed_methods=["GET", "PUT", "POST", "DELETE", "HEAD"],
+    respect_retry_after_header=True,
+    raise_on_status=False
+)
+
+GRAPH_THROTTLE_STATUSES = (429, 503)
+GRAPH_THROTTLE_MAX_RETRIES = 3
+# Pause ahead of throttling once less than 10% of Graph's RateLimit bucket remains
+GRAPH_RATE_LIMIT_RESERVE = 0.1
+
+# Microsoft Graph JSON batching: up to 20 sub-requests per POST
+GRAPH_BATCH_URL = "https://graph.microsoft.com/v1.0/$batch"
+GRAPH_BATCH_SIZE = 20
+GRAPH_BATCH_MAX_ATTEMPTS = 4
+# $batch calls in flight at once, shared by all threads of the uploader
+GRAPH_MAX_CONCURRENCY = 8
+
+# Resolved SharePoint sharing URL -> file info (successful resolutions only)
+SHAREPOINT_RESOLVE_CACHE_SIZE = 4096
+
+# Opt-in file for sharing the access token between worker processes, so each one doesn't refresh on startup.
+# Point it into a directory only the app user can write to; unset disables the cache.
+TOKEN_CACHE_FILE = os.getenv('ONEDRIVE_TOKEN_CACHE_FILE') or None
+
+# Graph's single PUT :/content upload is limited to 4 MB; larger files go through an upload session
+SIMPLE_UPLOAD_MAX_BYTES = 4 * 1024 * 1024
+UPLOAD_FRAGMENT_SIZE = 16 * 320 * 1024  # 5 MiB, upload session fragments must be multiples of 320 KiB
+
+# Downloads are streamed into a spool file that stays in memory up to this size
+DOWNLOAD_SPOOL_MAX_BYTES = 2 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+MIGRATION_BULK_WRITE_SIZE = 500
+
+# Stored SharePoint sharing URLs; anchored so the match stops at the host instead of scanning the whole value
+SHAREPOINT_URL_REGEX = {"$regex": r"^https?://[^/]*sharepoint\.com"}
+
+SHAREPOINT_IMAGE_FIELDS = ['start_image_file_id', 'end_image_file_id', 'audit_sheet_image_file_id']
+
+
+def parse_retry_after(value, default=1):
+    """Seconds to wait from a Retry-After header value (delay-seconds or HTTP-date)"""
+    if not value:
+        return default
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+def graph_json(response):
+    """Parse a Graph/login JSON response body with orjson"""
+    return orjson.loads(response.content)
+
+
+def encode_sharing_url(sharing_url):
+    """Encode a sharing URL as a Graph share ID (unpadded URL-safe base64, without the u! prefix)"""
+    encoded_url = base64.b64encode(sharing_url.encode('utf-8')).decode('utf-8')
+    return encoded_url.rstrip('=').replace('+', '-').replace('/', '_')
+
+
+def drive_item_file_info(file_data):
+    """File info dict for a resolved driveItem"""
+    return {
+        'file_id': file_data.get('id'),
+        'file_name': file_data.get('name'),
+        'size': file_data.get('size'),
+        'created_datetime': file_data.get('createdDateTime'),
+        'modified_datetime': file_data.get('lastModifiedDateTime')
+    }
+
+
+def decode_base64_image(image_data):
+    """Decode a base64 image string, with or without a data:image/...;base64, prefix"""
+    if image_data.startswith('data:image/'):
+        # Skip past the data URL header without splitting the whole payload
+        image_data = image_data[image_data.find(',') + 1:]
+    return base64.b64decode(image_data)
+
+
+def get_stream_size(file_stream):
+    """Size of a file object, rewound to the start, or None if it can't seek.
+
+    Uses seek/tell rather than seekable(): SpooledTemporaryFile (Werkzeug's multipart streams)
+    only gained seekable() in Python 3.11.
+    """
+    try:
+        file_stream.seek(0, os.SEEK_END)
+        file_size = file_stream.tell()
+        file_stream.seek(0)
+        return file_size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def resize_image_file(source, max_width=800, max_height=600, quality=85):
+    """Resize an image file object to fit max_width x max_height as JPEG, original bytes if it can't be processed"""
+    # PIL is only loaded by workers that actually resize images
+    from PIL import Image
+
+    try:
+        image = Image.open(source)
+
+        # Let libjpeg scale down while decoding (1/2, 1/4, 1/8) instead of decoding every pixel
+        image.draft('RGB', (max_width, max_height))
+
+        # Convert to RGB if necessary (for JPEG compatibility)
+        if image.mode in ('RGBA', 'P'):
+            image = image.convert('RGB')
+
+        # Shrink in place keeping the aspect ratio (never enlarges)
+        image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+        # Save to bytes; optimize/progressive roughly double encode time, only worth it at lower quality
+        output = io.BytesIO()
+        save_options = {'optimize': True, 'progressive': True} if quality < 90 else {}
+        image.save(output, format='JPEG', quality=quality, **save_options)
+
+        return output.getvalue()
+
+    except Exception as e:
+        logger.warning("Error processing image, returning original: %s", e)
+        # Return original content if resize fails
+        source.seek(0)
+        return source.read()
 
 
 class OneDriveUploader:
@@ -26,15 +174,130 @@ class OneDriveUploader:
         # Token cache
         self.access_token = None
         self.token_expires_at = None
+        self.token_lock = threading.Lock()
+
+        self.sharepoint_cache = LRUCache(maxsize=SHAREPOINT_RESOLVE_CACHE_SIZE)
+        self.sharepoint_cache_lock = threading.Lock()
+
+        # Folders already known to exist (a handful of YYYY/MM-Month paths over the app's lifetime)
+        self.known_folders = set()
+        self.known_folders_lock = threading.Lock()
+
+        # Persistent HTTP session (connection pooling + retries) for all OneDrive calls
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=32, max_retries=GRAPH_RETRY)
+        self.session.mount('https://login.microsoftonline.com', adapter)
+        self.session.mount('https://graph.microsoft.com', adapter)
+        self.session.headers.update({'User-Agent': 'BoostAudit/1.0'})
+        self.graph_semaphore = threading.Semaphore(GRAPH_MAX_CONCURRENCY)
+
+        # Monotonic time before which no call is sent, shared by all threads once Graph throttles us
+        self.quiet_until = 0.0
+        self.throttle_lock = threading.Lock()
+
+    def throttle(self, seconds):
+        """Hold back every call from this uploader for the given number of seconds"""
+        with self.throttle_lock:
+            self.quiet_until = max(self.quiet_until, time.monotonic() + seconds)
+
+    def check_rate_limit(self, response):
+        """Start backing off early when Graph's RateLimit headers show the bucket is almost used up"""
+        headers = response.headers
+        limit, remaining, reset = (headers.get('RateLimit-Limit'), headers.get('RateLimit-Remaining'),
+                                   headers.get('RateLimit-Reset'))
+        if not (limit and remaining and reset):
+            return
+        try:
+            if int(remaining) <= int(limit) * GRAPH_RATE_LIMIT_RESERVE:
+                self.throttle(float(reset))
+        except ValueError:
+            pass
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request on the shared session. Throttled responses (429/503) are retried up to 3 times after
+        their Retry-After delay, which also pauses every other thread instead of letting them add to the load.
+        """
+        for attempt in range(GRAPH_THROTTLE_MAX_RETRIES + 1):
+            delay = self.quiet_until - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            response = self.session.request(method, url, **kwargs)
+            self.check_rate_limit(response)
+
+            if response.status_code not in GRAPH_THROTTLE_STATUSES or attempt == GRAPH_THROTTLE_MAX_RETRIES:
+                return response
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            logger.warning("Graph throttled (%s) %s %s, retrying in %ss",
+                           response.status_code, method, url, retry_after)
+            self.throttle(retry_after)
+            response.close()
+
+            # Rewind streamed upload bodies before sending them again
+            body = kwargs.get('data')
+            if hasattr(body, 'seek'):
+                body.seek(0)
+
+    def load_cached_token(self):
+        """Load a still-valid access token persisted by another worker, True if one was found"""
+        if not TOKEN_CACHE_FILE:
+            return False
+        try:
+            fd = os.open(TOKEN_CACHE_FILE, os.O_RDONLY | os.O_NOFOLLOW)
+            with os.fdopen(fd) as token_file:
+                # Only trust a file this user created and nobody else can read or replace
+                stat = os.fstat(token_file.fileno())
+                if stat.st_uid != os.getuid() or stat.st_mode & 0o777 != 0o600:
+                    logger.warning("Ignoring OneDrive token cache %s: not owner-only", TOKEN_CACHE_FILE)
+                    return False
+                cached = json.load(token_file)
+            expires_at = datetime.fromtimestamp(cached['expires_at'])
+            if datetime.now() < expires_at:
+                self.access_token = cached['access_token']
+                self.token_expires_at = expires_at
+                return True
+        except (OSError, ValueError, KeyError):
+            pass
+        return False
+
+    def save_cached_token(self):
+        """Persist the access token for other workers (owner-only file, replaced atomically)"""
+        if not TOKEN_CACHE_FILE:
+            return
+        temp_path = None
+        try:
+            # mkstemp creates a fresh 0600 file with O_EXCL, so nothing pre-planted can be written through
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(TOKEN_CACHE_FILE)), suffix='.tmp')
+            with os.fdopen(fd, 'w') as token_file:
+                json.dump({'access_token': self.access_token, 'expires_at': self.token_expires_at.timestamp()},
+                          token_file)
+            os.replace(temp_path, TOKEN_CACHE_FILE)
+        except OSError as e:
+            logger.warning("Could not persist OneDrive access token: %s", e)
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
 
     def get_access_token(self):
         """Get or refresh the access token"""
+        # Check if current token is still valid
+        if self.access_token and self.token_expires_at and datetime.now() < self.token_expires_at:
+            return self.access_token
+
+        with self.token_lock:
+            return self.refresh_access_token()
+
+    def refresh_access_token(self):
+        """Refresh the access token (caller holds token_lock)"""
         try:
-            # Check if current token is still valid
+            # Another thread or worker may have refreshed it meanwhile
             if self.access_token and self.token_expires_at and datetime.now() < self.token_expires_at:
                 return self.access_token
+            if self.load_cached_token():
+                return self.access_token
 
-            print("🔄 Refreshing OneDrive access token...")
+            logger.debug("Refreshing OneDrive access token")
 
             data = {
                 'grant_type': 'refresh_token',
@@ -44,59 +307,50 @@ class OneDriveUploader:
                 'scope': 'https://graph.microsoft.com/Files.ReadWrite'
             }
 
-            response = requests.post(self.token_url, data=data)
+            response = self.request('POST', self.token_url, data=data)
             response.raise_for_status()
 
-            token_data = response.json()
+            token_data = graph_json(response)
             self.access_token = token_data['access_token']
 
             # Set expiration time (subtract 5 minutes for safety)
             expires_in = token_data.get('expires_in', 3600)
             self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 300)
+            self.save_cached_token()
 
-            print("✅ OneDrive access token refreshed successfully")
+            logger.debug("OneDrive access token refreshed")
             return self.access_token
 
         except Exception as e:
-            print(f"❌ Error getting OneDrive access token: {str(e)}")
+            logger.error("Error getting OneDrive access token: %s", e)
             raise Exception(f"Failed to get OneDrive access token: {str(e)}")
 
     def upload_file(self, file_data, filename, folder_path=""):
         """Upload file to OneDrive"""
         try:
-            access_token = self.get_access_token()
-
-            # Prepare the upload URL
-            if folder_path:
-                upload_url = f"{self.upload_url_base}/{folder_path}/{filename}:/content"
+            logger.debug("Uploading %s to OneDrive", filename)
+
+            # The body is always sent from a file object so requests streams it in blocks: streams
+            # (multipart uploads) and bytes are used as-is, only base64 strings need decoding
+            if hasattr(file_data, 'read'):
+                file_stream = file_data
+            elif isinstance(file_data, (bytes, bytearray)):
+                file_stream = io.BytesIO(file_data)
             else:
-                upload_url = f"{self.upload_url_base}/{filename}:/content"
+                file_stream = io.BytesIO(decode_base64_image(file_data))
 
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/octet-stream'
-            }
+            # Upload the file, through an upload session when it is over the simple upload limit
+            file_size = get_stream_size(file_stream)
 
-            print(f"📤 Uploading {filename} to OneDrive...")
-
-            # If file_data is base64, decode it
-            if isinstance(file_data, str):
-                if file_data.startswith('data:image/'):
-                    # Remove data URL prefix
-                    file_data = file_data.split(',')[1]
-                file_bytes = base64.b64decode(file_data)
+            if file_size is not None and file_size > SIMPLE_UPLOAD_MAX_BYTES:
+                upload_result = self.upload_file_large(file_stream, filename, folder_path, file_size)
             else:
-                file_bytes = file_data
-
-            # Upload the file
-            response = requests.put(upload_url, headers=headers, data=file_bytes)
-            response.raise_for_status()
+                upload_result = self.upload_file_simple(file_stream, filename, folder_path)
 
-            upload_result = response.json()
             file_id = upload_result.get('id')
             file_name = upload_result.get('name')
 
-            print(f"✅ File uploaded successfully. File ID: {file_id}")
+            logger.debug("File uploaded, file ID: %s", file_id)
 
             # Return file metadata including download URL
             return {
@@ -107,234 +361,272 @@ class OneDriveUploader:
             }
 
         except Exception as e:
-            print(f"❌ Error uploading to OneDrive: {str(e)}")
+            logger.exception("Error uploading to OneDrive")
             raise Exception(f"OneDrive upload failed: {str(e)}")
 
+    def upload_file_simple(self, file_stream, filename, folder_path=""):
+        """Upload a file of up to 4 MB with a single PUT, returns the driveItem"""
+        access_token = self.get_access_token()
+
+        # Prepare the upload URL
+        if folder_path:
+            upload_url = f"{self.upload_url_base}/{folder_path}/{filename}:/content"
+        else:
+            upload_url = f"{self.upload_url_base}/{filename}:/content"
+
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/octet-stream'
+        }
+
+        response = self.request('PUT', upload_url, headers=headers, data=file_stream)
+        response.raise_for_status()
+
+        return graph_json(response)
+
+    def upload_file_large(self, file_stream, filename, folder_path, file_size):
+        """Upload a file over 4 MB through a Graph upload session in 5 MiB fragments, returns the driveItem"""
+        access_token = self.get_access_token()
+
+        item_path = f"{folder_path}/{filename}" if folder_path else filename
+        session_response = self.request(
+            'POST',
+            f"{self.upload_url_base}/{item_path}:/createUploadSession",
+            headers={
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            },
+            data=orjson.dumps({'item': {'@microsoft.graph.conflictBehavior': 'replace'}})
+        )
+        session_response.raise_for_status()
+        upload_url = graph_json(session_response)['uploadUrl']
+
+        logger.debug("Uploading %s (%d bytes) in fragments", filename, file_size)
+
+        # Fragments must arrive in order; the pre-authenticated uploadUrl takes no Authorization header
+        start = 0
+        response = None
+        while start < file_size:
+            fragment = file_stream.read(UPLOAD_FRAGMENT_SIZE)
+            if not fragment:
+                raise Exception(f"Upload stream ended at byte {start} of {file_size}")
+
+            end = start + len(fragment) - 1
+            response = self.request('PUT', upload_url, headers={
+                'Content-Length': str(len(fragment)),
+                'Content-Range': f'bytes {start}-{end}/{file_size}'
+            }, data=fragment, timeout=60)
+            response.raise_for_status()
+            start = end + 1
+
+        # The response to the last fragment (200/201) carries the created driveItem
+        return graph_json(response)
+
     def resolve_sharepoint_sharing_url(self, sharing_url):
         """
         Convert SharePoint sharing URL to actual file ID using Microsoft Graph API
         """
+        with self.sharepoint_cache_lock:
+            cached_info = self.sharepoint_cache.get(sharing_url)
+        if cached_info is not None:
+            return cached_info
+
         try:
             access_token = self.get_access_token()
 
-            # Encode the sharing URL
-            encoded_url = base64.b64encode(sharing_url.encode('utf-8')).decode('utf-8')
-            # Remove padding and replace characters for URL-safe base64
-            encoded_url = encoded_url.rstrip('=').replace('+', '-').replace('/', '_')
-
             # Use the shares endpoint to resolve the sharing URL
-            shares_url = f"https://graph.microsoft.com/v1.0/shares/u!{encoded_url}/driveItem"
+            shares_url = f"https://graph.microsoft.com/v1.0/shares/u!{encode_sharing_url(sharing_url)}/driveItem"
 
             headers = {
                 'Authorization': f'Bearer {access_token}',
                 'Content-Type': 'application/json'
             }
 
-            print(f"🔍 Resolving SharePoint sharing URL: {sharing_url}")
+            logger.debug("Resolving SharePoint sharing URL: %s", sharing_url)
 
-            response = requests.get(shares_url, headers=headers)
+            response = self.request('GET', shares_url, headers=headers)
             response.raise_for_status()
 
-            file_data = response.json()
-            file_id = file_data.get('id')
+            file_info = drive_item_file_info(graph_json(response))
 
-            print(f"✅ Resolved SharePoint URL to file ID: {file_id}")
+            logger.debug("Resolved SharePoint URL to file ID: %s", file_info['file_id'])
 
-            return {
-                'file_id': file_id,
-                'file_name': file_data.get('name'),
-                'size': file_data.get('size'),
-                'created_datetime': file_data.get('createdDateTime'),
-                'modified_datetime': file_data.get('lastModifiedDateTime')
-            }
+            with self.sharepoint_cache_lock:
+                self.sharepoint_cache[sharing_url] = file_info
+            return file_info
 
         except Exception as e:
-            print(f"❌ Error resolving SharePoint sharing URL: {str(e)}")
+            logger.error("Error resolving SharePoint sharing URL: %s", e)
             return None
 
+    def resolve_sharepoint_sharing_urls_batch(self, sharing_urls):
+        """
+        Resolve many SharePoint sharing URLs with Graph $batch requests (20 URLs per HTTP call).
+        Returns file info dicts in the same order as sharing_urls, None where a URL could not be resolved.
+        """
+        chunks = [sharing_urls[start:start + GRAPH_BATCH_SIZE] for start in range(0, len(sharing_urls), GRAPH_BATCH_SIZE)]
+        if len(chunks) <= 1:
+            return [info for chunk in chunks for info in self.resolve_sharepoint_batch_chunk(chunk)]
+
+        # Batches are independent round trips, run several concurrently on the shared session
+        results = []
+        with ThreadPoolExecutor(max_workers=min(GRAPH_MAX_CONCURRENCY, len(chunks))) as executor:
+            for chunk_results in executor.map(self.resolve_sharepoint_batch_chunk, chunks):
+                results.extend(chunk_results)
+        return results
+
+    def resolve_sharepoint_batch_chunk(self, sharing_urls):
+        """Resolve up to 20 sharing URLs in one $batch call, retrying throttled sub-requests after Retry-After"""
+        results = [None] * len(sharing_urls)
+        pending = dict(enumerate(sharing_urls))
+
+        try:
+            for attempt in range(GRAPH_BATCH_MAX_ATTEMPTS):
+                access_token = self.get_access_token()
+                batch_body = {
+                    'requests': [
+                        {'id': str(index), 'method': 'GET', 'url': f"/shares/u!{encode_sharing_url(url)}/driveItem"}
+                        for index, url in pending.items()
+                    ]
+                }
+
+                with self.graph_semaphore:
+                    response = self.request('POST', GRAPH_BATCH_URL, headers={
+                        'Authorization': f'Bearer {access_token}',
+                        'Content-Type': 'application/json'
+                    }, data=orjson.dumps(batch_body))
+
+                response.raise_for_status()
+
+                retry_after = 0
+                for sub_response in graph_json(response).get('responses', []):
+                    index = int(sub_response['id'])
+                    status = sub_response.get('status')
+
+                    if status == 200:
+                        results[index] = drive_item_file_info(sub_response.get('body') or {})
+                        del pending[index]
+                    elif status in (429, 503):
+                        # Throttled: retry this sub-request in the next round
+                        headers = sub_response.get('headers') or {}
+                        retry_after = max(retry_after, parse_retry_after(headers.get('Retry-After')))
+                    else:
+                        logger.warning("Could not resolve SharePoint URL %s: %s", pending[index], status)
+                        del pending[index]
+
+                if not pending:
+                    break
+
+                # Only hold back the other threads when this chunk will actually retry
+                if attempt < GRAPH_BATCH_MAX_ATTEMPTS - 1:
+                    logger.warning("%d SharePoint URLs throttled, retrying in %ss", len(pending), retry_after)
+                    self.throttle(retry_after)
+                else:
+                    logger.warning("%d SharePoint URLs still throttled, giving up", len(pending))
+
+        except Exception:
+            logger.exception("Error resolving SharePoint sharing URLs batch")
+
+        return results
+
     def validate_file_id(self, file_id):
         """Validate if a file ID exists and is accessible"""
         try:
             access_token = self.get_access_token()
 
-            # Try different API endpoints to locate the file
-            endpoints_to_try = [
-                f"{self.graph_api_base}/me/drive/items/{file_id}",
-                f"{self.graph_api_base}/drives/me/items/{file_id}",
-            ]
-
+            endpoint = f"{self.graph_api_base}/me/drive/items/{file_id}"
             headers = {'Authorization': f'Bearer {access_token}'}
 
-            for endpoint in endpoints_to_try:
-                print(f"🔍 Trying endpoint: {endpoint}")
-                response = requests.get(endpoint, headers=headers)
-
-                if response.status_code == 200:
-                    file_data = response.json()
-                    print(f"✅ File found via {endpoint}")
-                    return {
-                        'exists': True,
-                        'file_data': file_data,
-                        'endpoint_used': endpoint
-                    }
-                else:
-                    print(f"❌ {endpoint} returned {response.status_code}: {response.text}")
+            response = self.request('GET', endpoint, headers=headers, timeout=10)
 
-            return {'exists': False, 'error': 'File not found in any endpoint'}
+            if response.status_code == 200:
+                return {
+                    'exists': True,
+                    'file_data': graph_json(response),
+                    'endpoint_used': endpoint
+                }
+
+            return {'exists': False, 'error': f'File lookup returned {response.status_code}'}
 
         except Exception as e:
-            print(f"❌ Error validating file ID: {str(e)}")
+            logger.error("Error validating file ID: %s", e)
             return {'exists': False, 'error': str(e)}
 
-    def get_file_download_url(self, file_id):
-        """Get direct download URL for a file with enhanced error handling"""
-        try:
-            access_token = self.get_access_token()
-
-            headers = {
-                'Authorization': f'Bearer {access_token}'
-            }
+    def iter_download(self, file_id, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """Yield file content from OneDrive in chunks as it arrives"""
+        access_token = self.get_access_token()
 
-            # Get file metadata including download URL
-            url = f"{self.graph_api_base}/me/drive/items/{file_id}"
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-
-            file_data = response.json()
-            download_url = file_data.get('@microsoft.graph.downloadUrl')
+        headers = {
+            'Authorization': f'Bearer {access_token}'
+        }
 
-            if download_url:
-                return download_url
+        # /content redirects to a pre-authenticated download URL, followed in the same call
+        # (requests drops the Authorization header on the cross-host redirect)
+        content_url = f"{self.graph_api_base}/me/drive/items/{file_id}/content"
 
-            # Fallback: try content endpoint
-            content_url = f"{self.graph_api_base}/me/drive/items/{file_id}/content"
-            content_response = requests.head(content_url, headers=headers, allow_redirects=False)
+        # Stream the file content instead of buffering the whole response
+        with self.request('GET', content_url, headers=headers, timeout=30, stream=True,
+                          allow_redirects=True) as response:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size=chunk_size)
 
-            if content_response.status_code == 302:
-                return content_response.headers.get('Location')
+    def download_file_to_spool(self, file_id):
+        """Stream file content from OneDrive into a rewound SpooledTemporaryFile"""
+        try:
+            spool = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MAX_BYTES)
+            for chunk in self.iter_download(file_id):
+                spool.write(chunk)
 
-            raise Exception("No download URL available")
+            spool.seek(0)
+            return spool
 
         except Exception as e:
-            print(f"❌ Error getting download URL: {str(e)}")
-            raise e
+            logger.error("Error downloading file content: %s", e)
+            raise Exception(f"Failed to download file: {str(e)}")
 
     def download_file_content(self, file_id):
         """Download file content from OneDrive"""
-        try:
-            access_token = self.get_access_token()
+        with self.download_file_to_spool(file_id) as spool:
+            return spool.read()
 
-            headers = {
-                'Authorization': f'Bearer {access_token}'
-            }
+    def resolve_sharing_url_file_id(self, sharing_url):
+        """Resolve a SharePoint sharing URL to its file ID, raising if it can't be resolved"""
+        file_info = self.resolve_sharepoint_sharing_url(sharing_url)
 
-            # Get download URL first
-            download_url = self.get_file_download_url(file_id)
-            if not download_url:
-                raise Exception("Could not get download URL")
+        if not file_info or not file_info.get('file_id'):
+            raise Exception("Could not resolve SharePoint sharing URL to file ID")
 
-            # Download the file content
-            response = requests.get(download_url, headers=headers, timeout=30)
-            response.raise_for_status()
-
-            return response.content
-
-        except Exception as e:
-            print(f"❌ Error downloading file content: {str(e)}")
-            raise Exception(f"Failed to download file: {str(e)}")
+        return file_info['file_id']
 
     def get_file_content_from_sharing_url(self, sharing_url):
         """
         Get file content directly from SharePoint sharing URL
         """
         try:
-            # First resolve the sharing URL to get the file ID
-            file_info = self.resolve_sharepoint_sharing_url(sharing_url)
-
-            if not file_info or not file_info.get('file_id'):
-                raise Exception("Could not resolve SharePoint sharing URL to file ID")
-
-            file_id = file_info['file_id']
-
-            # Now download using the file ID
-            return self.download_file_content(file_id)
+            # First resolve the sharing URL to get the file ID, then download using the file ID
+            return self.download_file_content(self.resolve_sharing_url_file_id(sharing_url))
 
         except Exception as e:
-            print(f"❌ Error getting content from sharing URL: {str(e)}")
+            logger.error("Error getting content from sharing URL: %s", e)
             raise e
 
     def get_resized_image(self, file_id, max_width=800, max_height=600, quality=85):
         """Download and resize image from OneDrive"""
-        try:
-            # Download original image
-            image_content = self.download_file_content(file_id)
-
-            # Open with PIL
-            image = Image.open(io.BytesIO(image_content))
-
-            # Convert to RGB if necessary (for JPEG compatibility)
-            if image.mode in ('RGBA', 'P'):
-                image = image.convert('RGB')
-
-            # Calculate new dimensions while maintaining aspect ratio
-            original_width, original_height = image.size
-            ratio = min(max_width / original_width, max_height / original_height)
-
-            if ratio < 1:  # Only resize if image is larger than max dimensions
-                new_width = int(original_width * ratio)
-                new_height = int(original_height * ratio)
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            # Save to bytes
-            output = io.BytesIO()
-            image.save(output, format='JPEG', quality=quality, optimize=True)
-            output.seek(0)
-
-            return output.getvalue()
-
-        except Exception as e:
-            print(f"❌ Error processing image: {str(e)}")
-            # Return original content if resize fails
-            return self.download_file_content(file_id)
+        with self.download_file_to_spool(file_id) as source:
+            return resize_image_file(source, max_width, max_height, quality)
 
     def get_resized_image_from_sharing_url(self, sharing_url, max_width=800, max_height=600, quality=85):
         """
         Get resized image from SharePoint sharing URL
         """
-        try:
-            # Get the file content
-            image_content = self.get_file_content_from_sharing_url(sharing_url)
-
-            # Open with PIL
-            image = Image.open(io.BytesIO(image_content))
-
-            # Convert to RGB if necessary (for JPEG compatibility)
-            if image.mode in ('RGBA', 'P'):
-                image = image.convert('RGB')
-
-            # Calculate new dimensions while maintaining aspect ratio
-            original_width, original_height = image.size
-            ratio = min(max_width / original_width, max_height / original_height)
-
-            if ratio < 1:  # Only resize if image is larger than max dimensions
-                new_width = int(original_width * ratio)
-                new_height = int(original_height * ratio)
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            # Save to bytes
-            output = io.BytesIO()
-            image.save(output, format='JPEG', quality=quality, optimize=True)
-            output.seek(0)
-
-            return output.getvalue()
-
-        except Exception as e:
-            print(f"❌ Error processing image from sharing URL: {str(e)}")
-            # Fallback to original content
-            return self.get_file_content_from_sharing_url(sharing_url)
+        return self.get_resized_image(self.resolve_sharing_url_file_id(sharing_url), max_width, max_height, quality)
 
     def create_folder_if_not_exists(self, folder_path):
         """Create folder structure if it doesn't exist"""
+        with self.known_folders_lock:
+            if folder_path in self.known_folders:
+                return
+
         try:
             access_token = self.get_access_token()
 
@@ -342,9 +634,13 @@ class OneDriveUploader:
             check_url = f"https://graph.microsoft.com/v1.0/me/drive/root:/MysteryAudits/{folder_path}"
             headers = {'Authorization': f'Bearer {access_token}'}
 
-            response = requests.get(check_url, headers=headers)
+            response = self.request('GET', check_url, headers=headers)
 
-            if response.status_code == 404:
+            if response.status_code == 200:
+                with self.known_folders_lock:
+                    self.known_folders.add(folder_path)
+
+            elif response.status_code == 404:
                 # Folder doesn't exist, create it
                 create_url = "https://graph.microsoft.com/v1.0/me/drive/root:/MysteryAudits:/children"
 
@@ -354,18 +650,20 @@ class OneDriveUploader:
                     "@microsoft.graph.conflictBehavior": "rename"
                 }
 
-                create_response = requests.post(create_url, headers={
+                create_response = self.request('POST', create_url, headers={
                     **headers,
                     'Content-Type': 'application/json'
-                }, json=data)
+                }, data=orjson.dumps(data))
 
                 if create_response.status_code in [200, 201]:
-                    print(f"✅ Folder created: {folder_path}")
+                    with self.known_folders_lock:
+                        self.known_folders.add(folder_path)
+                    logger.info("Folder created: %s", folder_path)
                 else:
-                    print(f"⚠️ Could not create folder {folder_path}: {create_response.text}")
+                    logger.warning("Could not create folder %s: %s", folder_path, create_response.text)
 
         except Exception as e:
-            print(f"⚠️ Error managing folder structure: {str(e)}")
+            logger.warning("Error managing folder structure: %s", e)
             # Continue without folder creation
 
 
@@ -378,7 +676,8 @@ def upload_to_onedrive_and_get_url(image_data, filename, use_date_folder=True):
     Upload image to OneDrive and return the file metadata
 
     Args:
-        image_data: Base64 encoded image or binary data
+        image_data: File-like object (e.g. a multipart upload stream), raw bytes,
+            or a base64 string / data:image/...;base64 URL
         filename: Name for the file
         use_date_folder: Whether to organize files in date folders
 
@@ -386,7 +685,7 @@ def upload_to_onedrive_and_get_url(image_data, filename, use_date_folder=True):
         dict: File metadata including file_id
     """
     try:
-        print(f"📤 Starting OneDrive upload for {filename}")
+        logger.debug("Starting OneDrive upload for %s", filename)
 
         # Create folder structure based on date if requested
         folder_path = ""
@@ -398,11 +697,11 @@ def upload_to_onedrive_and_get_url(image_data, filename, use_date_folder=True):
         # Upload the file
         file_metadata = onedrive_uploader.upload_file(image_data, filename, folder_path)
 
-        print(f"✅ OneDrive upload completed successfully")
+        logger.debug("OneDrive upload completed for %s", filename)
         return file_metadata
 
     except Exception as e:
-        print(f"❌ OneDrive upload failed: {str(e)}")
+        logger.error("OneDrive upload failed: %s", e)
         raise Exception(f"Failed to upload to OneDrive: {str(e)}")
 
 
@@ -417,12 +716,12 @@ def get_onedrive_file_info(file_id_or_url):
             access_token = onedrive_uploader.get_access_token()
             url = f"https://graph.microsoft.com/v1.0/me/drive/items/{file_id_or_url}"
             headers = {'Authorization': f'Bearer {access_token}'}
-            response = requests.get(url, headers=headers)
+            response = onedrive_uploader.request('GET', url, headers=headers)
             response.raise_for_status()
-            return response.json()
+            return graph_json(response)
 
     except Exception as e:
-        print(f"❌ Error getting OneDrive file info: {str(e)}")
+        logger.error("Error getting OneDrive file info: %s", e)
         return None
 
 
@@ -433,7 +732,7 @@ def get_onedrive_image_content(file_id_or_url, resize=True):
     try:
         # Check if it's a SharePoint sharing URL
         if isinstance(file_id_or_url, str) and 'sharepoint.com' in file_id_or_url:
-            print(f"🔗 Detected SharePoint sharing URL: {file_id_or_url}")
+            logger.debug("Detected SharePoint sharing URL: %s", file_id_or_url)
 
             if resize:
                 return onedrive_uploader.get_resized_image_from_sharing_url(file_id_or_url)
@@ -441,7 +740,7 @@ def get_onedrive_image_content(file_id_or_url, resize=True):
                 return onedrive_uploader.get_file_content_from_sharing_url(file_id_or_url)
         else:
             # Handle as regular file ID
-            print(f"🆔 Treating as file ID: {file_id_or_url}")
+            logger.debug("Treating as file ID: %s", file_id_or_url)
 
             if resize:
                 return onedrive_uploader.get_resized_image(file_id_or_url)
@@ -449,7 +748,7 @@ def get_onedrive_image_content(file_id_or_url, resize=True):
                 return onedrive_uploader.download_file_content(file_id_or_url)
 
     except Exception as e:
-        print(f"❌ Error getting image content: {str(e)}")
+        logger.error("Error getting image content: %s", e)
         return None
 
 
@@ -461,14 +760,14 @@ def delete_onedrive_file(file_id):
         url = f"https://graph.microsoft.com/v1.0/me/drive/items/{file_id}"
         headers = {'Authorization': f'Bearer {access_token}'}
 
-        response = requests.delete(url, headers=headers)
+        response = onedrive_uploader.request('DELETE', url, headers=headers)
         response.raise_for_status()
 
-        print(f"✅ File deleted from OneDrive: {file_id}")
+        logger.info("File deleted from OneDrive: %s", file_id)
         return True
 
     except Exception as e:
-        print(f"❌ Error deleting OneDrive file: {str(e)}")
+        logger.error("Error deleting OneDrive file: %s", e)
         return False
 
 
@@ -481,48 +780,50 @@ def convert_sharepoint_urls_to_file_ids(mongo_db):
         failed_count = 0
 
         # Find all audits with SharePoint URLs
-        sharepoint_query = {
-            "$or": [
-                {"start_image_file_id": {"$regex": "sharepoint.com"}},
-                {"end_image_file_id": {"$regex": "sharepoint.com"}},
-                {"audit_sheet_image_file_id": {"$regex": "sharepoint.com"}}
-            ]
-        }
+        sharepoint_query = {"$or": [{field: SHAREPOINT_URL_REGEX} for field in SHAREPOINT_IMAGE_FIELDS]}
 
-        audits_with_sharepoint_urls = list(mongo_db.school_audits.find(sharepoint_query))
+        # Only the image fields are needed, not the full audit documents
+        audits_with_sharepoint_urls = list(mongo_db.school_audits.find(
+            sharepoint_query,
+            {field: 1 for field in SHAREPOINT_IMAGE_FIELDS}
+        ))
 
-        print(f"🔍 Found {len(audits_with_sharepoint_urls)} audits with SharePoint URLs")
+        logger.info("Found %d audits with SharePoint URLs", len(audits_with_sharepoint_urls))
 
+        # Collect every (audit, field, URL) to convert
+        conversions = []
         for audit in audits_with_sharepoint_urls:
-            update_fields = {}
-
-            # Process each image field
-            for field in ['start_image_file_id', 'end_image_file_id', 'audit_sheet_image_file_id']:
-                if field in audit:
-                    value = audit[field]
-
-                    if isinstance(value, str) and 'sharepoint.com' in value:
-                        print(f"🔄 Converting {field} for audit {audit['_id']}")
-
-                        # Resolve SharePoint URL to file ID
-                        file_info = onedrive_uploader.resolve_sharepoint_sharing_url(value)
-
-                        if file_info and file_info.get('file_id'):
-                            update_fields[field] = file_info['file_id']
-                            # Keep original URL as backup
-                            update_fields[f"{field}_original_sharepoint_url"] = value
-                            converted_count += 1
-                            print(f"✅ Converted {field}: {file_info['file_id']}")
-                        else:
-                            print(f"❌ Failed to convert {field}: {value}")
-                            failed_count += 1
-
-            # Update the audit record if we have conversions
-            if update_fields:
-                mongo_db.school_audits.update_one(
-                    {"_id": audit['_id']},
-                    {"$set": update_fields}
-                )
+            for field in SHAREPOINT_IMAGE_FIELDS:
+                value = audit.get(field)
+                if isinstance(value, str) and 'sharepoint.com' in value:
+                    conversions.append((audit['_id'], field, value))
+
+        # Resolve each distinct URL once, 20 per Graph $batch call
+        sharing_urls = list(dict.fromkeys(url for _, _, url in conversions))
+        logger.info("Resolving %d SharePoint URLs", len(sharing_urls))
+        resolved = dict(zip(sharing_urls, onedrive_uploader.resolve_sharepoint_sharing_urls_batch(sharing_urls)))
+
+        update_fields_by_audit = {}
+        for audit_id, field, value in conversions:
+            file_info = resolved.get(value)
+
+            if file_info and file_info.get('file_id'):
+                update_fields = update_fields_by_audit.setdefault(audit_id, {})
+                update_fields[field] = file_info['file_id']
+                # Keep original URL as backup
+                update_fields[f"{field}_original_sharepoint_url"] = value
+                converted_count += 1
+            else:
+                logger.warning("Failed to convert %s for audit %s: %s", field, audit_id, value)
+                failed_count += 1
+
+        # Update converted audit records with unordered bulk writes of up to 500 operations
+        operations = [
+            UpdateOne({"_id": audit_id}, {"$set": update_fields})
+            for audit_id, update_fields in update_fields_by_audit.items()
+        ]
+        for start in range(0, len(operations), MIGRATION_BULK_WRITE_SIZE):
+            mongo_db.school_audits.bulk_write(operations[start:start + MIGRATION_BULK_WRITE_SIZE], ordered=False)
 
         return {
             'converted_count': converted_count,
@@ -531,5 +832,5 @@ def convert_sharepoint_urls_to_file_ids(mongo_db):
         }
 
     except Exception as e:
-        print(f"❌ Error converting SharePoint URLs: {str(e)}")
+        logger.exception("Error converting SharePoint URLs")
         return {'error': str(e)}
\ No newline at end of file
@@ -0,0 +1,21 @@
+import orjson
+from flask.json.provider import JSONProvider, DefaultJSONProvider
+
+# Datetimes are passed through to Flask's default conversion so responses keep
+# the same HTTP-date format as before; non-string dict keys are stringified.
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def orjson_dumps(obj):
+    """Serialize obj to JSON bytes using orjson with Flask's fallback conversions"""
+    return orjson.dumps(obj, default=DefaultJSONProvider.default, option=ORJSON_OPTIONS)
+
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for faster encoding of large responses"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson_dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
@@ -1,28 +1,44 @@
 import jwt
 import datetime
+import time
 from flask import current_app
 
+# SECRET_KEY encoded once per app (keyed by id of the app object)
+secret_key_cache = {}
+
+
+def get_secret_key():
+    """Get the current app's SECRET_KEY as bytes, encoded on first use"""
+    app = current_app._get_current_object()
+    secret = secret_key_cache.get(id(app))
+    if secret is None:
+        secret = secret_key_cache[id(app)] = app.config['SECRET_KEY'].encode('utf-8')
+    return secret
+
 
 def generate_tokens(user_id, role):
     """Generate both access token and refresh token"""
     try:
+        secret = get_secret_key()
+        now = datetime.datetime.now(datetime.timezone.utc)
+
         # Access token (shorter expiration)
         access_payload = {
             "user_id": str(user_id),
             "role": role,
             "type": "access",
-            "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=2)  # 2 hours
+            "exp": now + datetime.timedelta(hours=2)  # 2 hours
         }
-        access_token = jwt.encode(access_payload, current_app.config['SECRET_KEY'], algorithm="HS256")
+        access_token = jwt.encode(access_payload, secret, algorithm="HS256")
 
         # Refresh token (longer expiration)
         refresh_payload = {
             "user_id": str(user_id),
             "role": role,
             "type": "refresh",
-            "exp": datetime.datetime.utcnow() + datetime.timedelta(days=7)  # 7 days
+            "exp": now + datetime.timedelta(days=7)  # 7 days
         }
-        refresh_token = jwt.encode(refresh_payload, current_app.config['SECRET_KEY'], algorithm="HS256")
+        refresh_token = jwt.encode(refresh_payload, secret, algorithm="HS256")
 
         return access_token, refresh_token
     except Exception as e:
@@ -36,9 +52,9 @@ def generate_token(user_id, role):
         payload = {
             "user_id": str(user_id),
             "role": role,
-            "exp": datetime.datetime.utcnow() + datetime.timedelta(days=7)  # Extended to 7 days for development
+            "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=7)  # Extended to 7 days for development
         }
-        token = jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm="HS256")
+        token = jwt.encode(payload, get_secret_key(), algorithm="HS256")
         return token
     except Exception as e:
         print("❌ Error generating token:", str(e))
@@ -48,7 +64,7 @@ def generate_token(user_id, role):
 def decode_token(token):
     """Decode and validate token"""
     try:
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+        payload = jwt.decode(token, get_secret_key(), algorithms=["HS256"])
         return payload
     except jwt.ExpiredSignatureError:
         print("❌ Token expired")
@@ -61,7 +77,7 @@ def decode_token(token):
 def refresh_access_token(refresh_token):
     """Generate new access token using refresh token"""
     try:
-        payload = jwt.decode(refresh_token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+        payload = jwt.decode(refresh_token, get_secret_key(), algorithms=["HS256"])
 
         if payload.get('type') != 'refresh':
             print("❌ Invalid token type for refresh")
@@ -79,11 +95,10 @@ def refresh_access_token(refresh_token):
 
 
 def is_token_expired(token):
-    """Check if token is expired without decoding"""
+    """Check if token is expired without verifying its signature (a precheck, use decode_token to trust it)"""
     try:
-        jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-        return False
-    except jwt.ExpiredSignatureError:
-        return True
-    except jwt.InvalidTokenError:
+        payload = jwt.decode(token, options={"verify_signature": False})
+        exp = payload.get('exp')
+        return exp is not None and exp < time.time()
+    except (jwt.InvalidTokenError, TypeError):
         return True
\ No newline at end of file
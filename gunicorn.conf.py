@@ -0,0 +1,12 @@
+import multiprocessing
+import os
+
+# The app is I/O bound (MongoDB, Microsoft Graph, attendance API): a few worker processes,
+# each serving several requests at once on threads. Loaded automatically by gunicorn.
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+worker_class = "gthread"
+# Each worker holds its own image cache (IMAGE_CACHE_MAX_BYTES, 64 MB by default); when raising
+# WEB_CONCURRENCY on a small instance, lower IMAGE_CACHE_MAX_BYTES so the total still fits in memory
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 4)))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = 120
@@ -1,6 +1,13 @@
 import os
+import logging
 from app import create_app
 
+# Single stderr handler for module loggers (e.g. OneDrive uploads); set LOG_LEVEL=DEBUG for per-call detail
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+
 app = create_app()  # Factory creates Flask app
 
 if __name__ == "__main__":